@@ -4,18 +4,32 @@ TalentHub RAG API - Versión Optimizada
 Sistema de búsqueda vectorial sin dependencia de LLM
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 import os
 from functools import lru_cache
+from collections import OrderedDict
+import asyncio
 import hashlib
+import secrets
 import json
+import queue
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
 
 # Imports para RAG
+import chromadb
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from sentence_transformers import CrossEncoder
 
@@ -33,6 +47,49 @@ app.add_middleware(
 
 CHROMA_DB_DIR = "./chroma_db"
 CACHE_DIR = "./cache"
+COLLECTION_NAME = "talent_profiles"
+
+# Particionado del índice: "hash" (por id de perfil) o "location" (una partición por ciudad)
+SHARD_STRATEGY = os.getenv("SHARD_STRATEGY", "hash")
+NUM_SHARDS = int(os.getenv("NUM_SHARDS", "4"))
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", "4"))
+
+# Compactación: proporción de perfiles borrados a partir de la cual se compacta en segundo plano
+COMPACTION_THRESHOLD = float(os.getenv("COMPACTION_THRESHOLD", "0.2"))
+
+# Cola de indexación: tamaño de lote de embeddings y segundos máximos antes de escribir
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+INDEX_FLUSH_INTERVAL = float(os.getenv("INDEX_FLUSH_INTERVAL", "1.0"))
+# Espera máxima de una escritura síncrona (flush, PUT, DELETE) a que se vacíe la cola
+INDEX_FLUSH_TIMEOUT = float(os.getenv("INDEX_FLUSH_TIMEOUT", "30"))
+
+# Paginación: candidatos recuperados por búsqueda paginada, vida de los cursores y límites de memoria
+PAGED_SEARCH_DEPTH = int(os.getenv("PAGED_SEARCH_DEPTH", "100"))
+CURSOR_TTL = float(os.getenv("CURSOR_TTL", "600"))
+CURSOR_MAX_ENTRIES = int(os.getenv("CURSOR_MAX_ENTRIES", "500"))
+CURSOR_MAX_MEMORY_MB = int(os.getenv("CURSOR_MAX_MEMORY_MB", "64"))
+
+# Registro de queries y calentamiento del caché con las N búsquedas más frecuentes
+QUERY_LOG_FILE = os.getenv("QUERY_LOG_FILE", "./logs/query_log.jsonl")
+WARMUP_QUERIES = int(os.getenv("WARMUP_QUERIES", "20"))
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "2.0"))
+WARMUP_LOG_WINDOW = int(os.getenv("WARMUP_LOG_WINDOW", "50000"))
+QUERY_LOG_MAX_MB = int(os.getenv("QUERY_LOG_MAX_MB", "50"))
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Snapshots del índice: directorio y snapshot a cargar al arrancar si el índice está vacío
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+SNAPSHOT_ON_START = os.getenv("SNAPSHOT_ON_START", "")
+
+# Caché semántico: similitud coseno mínima para reutilizar resultados de otra query
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+# Presupuesto de latencia: deadline por defecto (0 = sin límite) y búsquedas
+# simultáneas a partir de las cuales el servidor se considera cargado
+DEFAULT_DEADLINE_MS = int(os.getenv("DEFAULT_DEADLINE_MS", "0"))
+LOAD_HIGH_WATERMARK = int(os.getenv("LOAD_HIGH_WATERMARK", "4"))
 
 # ==================== MODELOS ====================
 
@@ -40,12 +97,14 @@ class QueryRequest(BaseModel):
     query: str
     filters: Optional[Dict] = {}
     top_k: int = 5
+    deadline_ms: Optional[int] = None
 
 class QueryResponse(BaseModel):
     response: str
     professionals: List[Dict]
     query: str
     cached: bool = False
+    degradations: List[str] = []
 
 class ProfileIndexRequest(BaseModel):
     id: int
@@ -61,22 +120,518 @@ class ProfileIndexRequest(BaseModel):
     rating: float
     availability: str
 
+class PagedQueryRequest(BaseModel):
+    query: str
+    filters: Optional[Dict] = {}
+    page_size: int = 5
+
+class NextPageRequest(BaseModel):
+    cursor: str
+
+class PagedQueryResponse(BaseModel):
+    response: str
+    professionals: List[Dict]
+    query: str
+    page: int
+    cursor: Optional[str] = None
+    has_more: bool
+    total_candidates: int
+
+class SnapshotRequest(BaseModel):
+    name: Optional[str] = None
+
+# ==================== VECTOR STORE PARTICIONADO ====================
+
+def slugify(value: str) -> str:
+    """Convierte un texto en un identificador válido para nombres de colección"""
+    text = unicodedata.normalize('NFKD', str(value).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    # 30 caracteres: el nombre de colección (máx. 63) lleva prefijo y sufijos temporales
+    return re.sub(r'[^a-z0-9]+', '-', text).strip('-')[:30].strip('-') or 'sin-ciudad'
+
+def get_location(metadata: Dict) -> Dict:
+    """Extrae la ubicación de la metadata (guardada como JSON en ChromaDB)"""
+    location = metadata.get('location', {})
+    if isinstance(location, str):
+        try:
+            location = json.loads(location)
+        except ValueError:
+            return {}
+    return location if isinstance(location, dict) else {}
+
+RECENTLY_COMPACTED_MAX = 10000
+
+class ShardedVectorStore:
+    """
+    Índice vectorial repartido en varias colecciones de ChromaDB.
+    Las búsquedas se lanzan en paralelo sobre las particiones relevantes y se
+    combinan los mejores resultados por distancia.
+
+    Los borrados se registran como tombstones (ids que las búsquedas ignoran) y se
+    eliminan físicamente al compactar.
+    """
+
+    def __init__(self, client, embedding_function, base_name: str = COLLECTION_NAME,
+                 strategy: str = SHARD_STRATEGY, num_shards: int = NUM_SHARDS,
+                 max_workers: int = SHARD_SEARCH_WORKERS, tombstone_file: Optional[str] = None,
+                 layout_file: Optional[str] = None):
+        if strategy not in ("hash", "location"):
+            raise ValueError(f"Estrategia de particionado desconocida: {strategy}")
+
+        self.client = client
+        self.embedding_function = embedding_function
+        self.base_name = base_name
+        self.strategy = strategy
+        self.num_shards = max(num_shards, 1)
+        self._lock = threading.Lock()
+        # Serializa escrituras y reconstrucciones para no perder inserciones concurrentes
+        self._write_lock = threading.RLock()
+        self._collections = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard-search")
+
+        self.tombstone_file = tombstone_file
+        self._tombstones = set()
+        # Ids eliminados en compactaciones recientes (orden de inserción, tamaño acotado)
+        self._recently_compacted: OrderedDict = OrderedDict()
+        if tombstone_file and os.path.exists(tombstone_file):
+            with open(tombstone_file, 'r', encoding='utf-8') as f:
+                self._tombstones = set(json.load(f))
+
+        # Se abren las particiones con la distribución con la que se escribieron; si la
+        # configuración cambió, apply_layout() re-particiona antes de servir búsquedas
+        self.layout_file = layout_file
+        self.stored_layout = None
+        if layout_file and os.path.exists(layout_file):
+            with open(layout_file, 'r', encoding='utf-8') as f:
+                self.stored_layout = json.load(f)
+        self._open_layout(self.stored_layout or self.layout())
+
+    def layout(self) -> Dict:
+        """Distribución configurada (el número de particiones sólo aplica al particionado por hash)"""
+        return {"strategy": self.strategy,
+                "num_shards": self.num_shards if self.strategy == "hash" else None}
+
+    def _open_layout(self, layout: Dict):
+        if layout["strategy"] == "hash":
+            for i in range(layout["num_shards"]):
+                self._get_collection(self._hash_shard_name(i))
+        else:
+            prefix = f"{self.base_name}_loc_"
+            for collection in self.client.list_collections():
+                name = getattr(collection, "name", collection)
+                if name.startswith(prefix):
+                    self._get_collection(name)
+
+    def _save_layout(self):
+        if not self.layout_file:
+            return
+        tmp_file = f"{self.layout_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.layout(), f)
+        os.replace(tmp_file, self.layout_file)
+        self.stored_layout = self.layout()
+
+    def apply_layout(self) -> int:
+        """
+        Si la distribución guardada difiere de la configurada (NUM_SHARDS o SHARD_STRATEGY),
+        re-particiona con los embeddings almacenados. Devuelve los perfiles redistribuidos.
+        """
+        if self.stored_layout == self.layout():
+            return 0
+        if self.stored_layout is None:
+            # Primer arranque (o índice anterior a este registro): la configuración es la vigente
+            self._save_layout()
+            return 0
+
+        with self._write_lock:
+            ids, matrix, documents, metadatas = self.export_data()
+            batch = 1000
+            total = self.replace_all(
+                (ids[i:i + batch], matrix[i:i + batch], documents[i:i + batch], metadatas[i:i + batch])
+                for i in range(0, len(ids), batch)
+            )
+            self._save_layout()
+        return total
+
+    # ---------- Enrutado ----------
+
+    def _hash_shard_name(self, index: int) -> str:
+        return f"{self.base_name}_shard_{index:02d}"
+
+    def _location_shard_name(self, city: str) -> str:
+        return f"{self.base_name}_loc_{slugify(city)}"
+
+    def shard_for(self, doc_id: str, metadata: Dict) -> str:
+        """Partición destino de un documento"""
+        if self.strategy == "hash":
+            digest = int(hashlib.md5(str(doc_id).encode()).hexdigest(), 16)
+            return self._hash_shard_name(digest % self.num_shards)
+        return self._location_shard_name(get_location(metadata).get('city', ''))
+
+    def shards_for_filters(self, filters: Optional[Dict]) -> List[str]:
+        """Particiones que hay que consultar (con filtro de ciudad sólo las que coinciden)"""
+        with self._lock:
+            names = list(self._collections)
+
+        cities = (filters or {}).get('city')
+        if self.strategy != "location" or not cities:
+            return names
+
+        if isinstance(cities, str):
+            cities = [cities]
+        wanted = {self._location_shard_name(city) for city in cities}
+        return [name for name in names if name in wanted]
+
+    def _get_collection(self, name: str):
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self.client.get_or_create_collection(
+                    name=name, metadata={"hnsw:space": "cosine"}
+                )
+                self._collections[name] = collection
+            return collection
+
+    @staticmethod
+    def document_id(metadata: Dict) -> str:
+        """Id estable del documento: el id del perfil si existe"""
+        return str(metadata['id']) if 'id' in metadata else str(uuid.uuid4())
+
+    # ---------- Escritura ----------
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        """Embebe los documentos en un único lote y los inserta (upsert) en su partición"""
+        if not documents:
+            return []
+
+        vectors = self.embedding_function.embed_documents([doc.page_content for doc in documents])
+        return self.add_embeddings(
+            ids=[self.document_id(doc.metadata) for doc in documents],
+            embeddings=vectors,
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+        )
+
+    def _group_by_shard(self, ids: List[str], embeddings, documents: List[str],
+                        metadatas: List[Dict]) -> Dict[str, Dict[str, list]]:
+        groups: Dict[str, Dict[str, list]] = {}
+        for doc_id, vector, text, metadata in zip(ids, embeddings, documents, metadatas):
+            group = groups.setdefault(self.shard_for(doc_id, metadata),
+                                      {"ids": [], "embeddings": [], "documents": [], "metadatas": []})
+            group["ids"].append(doc_id)
+            group["embeddings"].append([float(x) for x in vector])
+            group["documents"].append(text)
+            group["metadatas"].append(metadata)
+        return groups
+
+    def add_embeddings(self, ids: List[str], embeddings, documents: List[str],
+                       metadatas: List[Dict]) -> List[str]:
+        """Inserta documentos con embeddings ya calculados"""
+        groups = self._group_by_shard(ids, embeddings, documents, metadatas)
+
+        with self._write_lock:
+            for name, group in groups.items():
+                # Con particionado por ciudad un perfil puede haber cambiado de partición
+                if self.strategy == "location":
+                    for other in self.shards_for_filters(None):
+                        if other != name:
+                            self._get_collection(other).delete(ids=group["ids"])
+                self._get_collection(name).upsert(**group)
+
+            # Un perfil re-indexado deja de estar borrado
+            for doc_id in ids:
+                self._recently_compacted.pop(doc_id, None)
+            revived = self._tombstones.intersection(ids)
+            if revived:
+                self._tombstones.difference_update(revived)
+                self._save_tombstones()
+
+        return list(ids)
+
+    # ---------- Lectura ----------
+
+    @staticmethod
+    def _query_collection(collection, embedding, k: int, where: Optional[Dict] = None) -> Optional[Dict]:
+        n_results = min(k, collection.count())
+        if n_results == 0:
+            return None
+        return collection.query(
+            query_embeddings=[list(embedding)],
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+
+    def _query_shard(self, name: str, embedding, k: int) -> List[Tuple[Document, float]]:
+        # Los perfiles borrados aún no compactados se excluyen en la propia consulta (el id
+        # del perfil está en la metadata como entero), sin pedir resultados de más
+        tombstones = frozenset(self._tombstones)
+        dead_ids = sorted(int(doc_id) for doc_id in tombstones if doc_id.isdigit())
+        where = {"id": {"$nin": dead_ids}} if dead_ids else None
+        # Ids sin equivalente numérico: se compensan pidiendo tantos resultados extra
+        k += len(tombstones) - len(dead_ids)
+
+        try:
+            result = self._query_collection(self._get_collection(name), embedding, k, where)
+        except Exception:
+            # La partición pudo reemplazarse durante una reconstrucción: reintentar una vez
+            result = self._query_collection(self._get_collection(name), embedding, k, where)
+        if result is None:
+            return []
+
+        return [
+            (Document(page_content=text, metadata=metadata or {}), distance)
+            for doc_id, text, metadata, distance in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+            if doc_id not in tombstones
+        ]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4,
+                                    filters: Optional[Dict] = None) -> List[Document]:
+        """Scatter-gather: consulta las particiones en paralelo y combina el top-k global"""
+        names = self.shards_for_filters(filters)
+        futures = [self._executor.submit(self._query_shard, name, embedding, k) for name in names]
+
+        hits = []
+        for future in futures:
+            hits.extend(future.result())
+        hits.sort(key=lambda hit: hit[1])
+        return [doc for doc, _ in hits[:k]]
+
+    def similarity_search(self, query: str, k: int = 4, filters: Optional[Dict] = None) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, filters)
+
+    def shard_counts(self) -> Dict[str, int]:
+        with self._lock:
+            collections = dict(self._collections)
+        return {name: collection.count() for name, collection in collections.items()}
+
+    def stored_count(self) -> int:
+        """Entradas almacenadas físicamente (incluye las borradas sin compactar)"""
+        return sum(self.shard_counts().values())
+
+    def count(self) -> int:
+        """Perfiles vivos"""
+        return self.stored_count() - len(self._tombstones)
+
+    def is_deleted(self, doc_id: str) -> bool:
+        """Borrado pendiente de compactar o eliminado en una compactación reciente"""
+        return doc_id in self._tombstones or doc_id in self._recently_compacted
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        """Busca un perfil vivo por id"""
+        if doc_id in self._tombstones:
+            return None
+
+        names = [self.shard_for(doc_id, {})] if self.strategy == "hash" else self.shards_for_filters(None)
+        for name in names:
+            data = self._get_collection(name).get(ids=[doc_id], include=["documents", "metadatas"])
+            if data["ids"]:
+                return Document(page_content=data["documents"][0], metadata=data["metadatas"][0] or {})
+        return None
+
+    # ---------- Borrado ----------
+
+    def _save_tombstones(self):
+        if not self.tombstone_file:
+            return
+        tmp_file = f"{self.tombstone_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(sorted(self._tombstones), f)
+        os.replace(tmp_file, self.tombstone_file)
+
+    def mark_deleted(self, doc_id: str) -> bool:
+        """Marca un perfil como borrado (efecto inmediato en búsquedas). False si no existe"""
+        with self._write_lock:
+            if self.get_document(doc_id) is None:
+                return False
+            self._tombstones.add(doc_id)
+            self._save_tombstones()
+            return True
+
+    def tombstone_stats(self) -> Dict:
+        stored = self.stored_count()
+        dead = len(self._tombstones)
+        return {
+            "live": stored - dead,
+            "dead": dead,
+            "dead_ratio": round(dead / stored, 4) if stored else 0.0,
+        }
+
+    def compact(self) -> Dict:
+        """Elimina físicamente los perfiles borrados y reconstruye las particiones afectadas"""
+        with self._write_lock:
+            dead = list(self._tombstones)
+            if not dead:
+                return {"removed": 0, "rebuilt_shards": []}
+
+            rebuilt = []
+            for name in self.shards_for_filters(None):
+                present = self._get_collection(name).get(ids=dead, include=[])["ids"]
+                if present:
+                    self._get_collection(name).delete(ids=present)
+                    self.rebuild_shard(name)
+                    rebuilt.append(name)
+
+            self._tombstones.difference_update(dead)
+            self._save_tombstones()
+            # Los cursores de paginación guardados aún pueden referenciar estos perfiles
+            self._recently_compacted.update(dict.fromkeys(dead))
+            while len(self._recently_compacted) > RECENTLY_COMPACTED_MAX:
+                self._recently_compacted.popitem(last=False)
+            return {"removed": len(dead), "rebuilt_shards": rebuilt}
+
+    # ---------- Mantenimiento ----------
+
+    def rebuild_shard(self, name: str) -> int:
+        """
+        Reconstruye una partición con sus embeddings ya calculados (sin re-embeber).
+        Compacta el índice HNSW y descarta entradas borradas. Las búsquedas siguen
+        usando la partición antigua hasta que la nueva está completa.
+        """
+        with self._lock:
+            if name not in self._collections:
+                raise KeyError(name)
+
+        with self._write_lock:
+            data = self._get_collection(name).get(include=["embeddings", "documents", "metadatas"])
+
+            temp_name = f"{name}__rebuild"
+            names = [getattr(c, "name", c) for c in self.client.list_collections()]
+            if temp_name in names:
+                self.client.delete_collection(temp_name)
+            rebuilt = self.client.create_collection(name=temp_name, metadata={"hnsw:space": "cosine"})
+
+            batch = 1000
+            for start in range(0, len(data["ids"]), batch):
+                end = start + batch
+                rebuilt.add(
+                    ids=data["ids"][start:end],
+                    embeddings=[list(v) for v in data["embeddings"][start:end]],
+                    documents=data["documents"][start:end],
+                    metadatas=data["metadatas"][start:end],
+                )
+
+            with self._lock:
+                self.client.delete_collection(name)
+                rebuilt.modify(name=name)
+                self._collections[name] = rebuilt
+
+        return len(data["ids"])
+
+    def export_data(self) -> Tuple[List[str], np.ndarray, List[str], List[Dict]]:
+        """Devuelve ids, matriz de embeddings, textos y metadata de todas las particiones"""
+        ids, vectors, documents, metadatas = [], [], [], []
+        with self._write_lock:
+            for name in sorted(self.shard_counts()):
+                data = self._get_collection(name).get(include=["embeddings", "documents", "metadatas"])
+                for doc_id, vector, text, metadata in zip(
+                    data["ids"], data["embeddings"], data["documents"], data["metadatas"]
+                ):
+                    if doc_id in self._tombstones:
+                        continue
+                    ids.append(doc_id)
+                    vectors.append(vector)
+                    documents.append(text)
+                    metadatas.append(metadata or {})
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return ids, matrix, documents, metadatas
+
+    def replace_all(self, batches) -> int:
+        """
+        Reemplaza todo el índice con los lotes (ids, embeddings, textos, metadata) recibidos.
+        Se cargan en colecciones temporales y se intercambian al final: mientras tanto las
+        búsquedas usan el índice actual, y si la carga falla éste queda intacto.
+        """
+        temp = {}
+
+        def temp_collection(name: str):
+            if name not in temp:
+                temp_name = f"{name}__import"
+                existing = [getattr(c, "name", c) for c in self.client.list_collections()]
+                if temp_name in existing:
+                    self.client.delete_collection(temp_name)
+                temp[name] = self.client.create_collection(name=temp_name, metadata={"hnsw:space": "cosine"})
+            return temp[name]
+
+        with self._write_lock:
+            try:
+                if self.strategy == "hash":
+                    for i in range(self.num_shards):
+                        temp_collection(self._hash_shard_name(i))
+
+                total = 0
+                for ids, embeddings, documents, metadatas in batches:
+                    for name, group in self._group_by_shard(ids, embeddings, documents, metadatas).items():
+                        temp_collection(name).upsert(**group)
+                    total += len(ids)
+            except Exception:
+                for collection in temp.values():
+                    self.client.delete_collection(collection.name)
+                raise
+
+            with self._lock:
+                for name in list(self._collections):
+                    self.client.delete_collection(name)
+                self._collections.clear()
+                for name, collection in temp.items():
+                    collection.modify(name=name)
+                    self._collections[name] = collection
+                self._tombstones.clear()
+                self._save_tombstones()
+
+        return total
+
+    def migrate_legacy_collection(self) -> int:
+        """
+        Reparte la colección única anterior entre las particiones y la elimina.
+        Si las particiones ya tienen datos, la colección es un resto de una migración
+        previa y se elimina sin copiarla (copiarla resucitaría perfiles borrados).
+        """
+        names = [getattr(c, "name", c) for c in self.client.list_collections()]
+        if self.base_name not in names:
+            return 0
+
+        migrated = 0
+        if self.stored_count() == 0:
+            data = self.client.get_collection(self.base_name).get(
+                include=["embeddings", "documents", "metadatas"]
+            )
+            if data["ids"]:
+                metadatas = [metadata or {} for metadata in data["metadatas"]]
+                ids = [str(m['id']) if 'id' in m else doc_id for doc_id, m in zip(data["ids"], metadatas)]
+                self.add_embeddings(ids, data["embeddings"], data["documents"], metadatas)
+                migrated = len(ids)
+
+        self.client.delete_collection(self.base_name)
+        return migrated
+
 # ==================== INICIALIZACIÓN ====================
 
 print("🚀 Inicializando sistema RAG...")
 
 # 1. EMBEDDINGS
 embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2",
+    model_name=EMBEDDING_MODEL,
     model_kwargs={'device': 'cpu'}
 )
 
-# 2. VECTOR STORE
-vectorstore = Chroma(
-    persist_directory=CHROMA_DB_DIR,
-    embedding_function=embeddings,
-    collection_name="talent_profiles"
+# 2. VECTOR STORE (particionado)
+chroma_client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+vectorstore = ShardedVectorStore(
+    chroma_client, embeddings,
+    tombstone_file=os.path.join(CHROMA_DB_DIR, "tombstones.json"),
+    layout_file=os.path.join(CHROMA_DB_DIR, "shard_layout.json")
 )
+previous_layout = vectorstore.stored_layout
+resharded = vectorstore.apply_layout()
+if previous_layout and previous_layout != vectorstore.layout():
+    print(f"✅ {resharded} perfiles redistribuidos: {previous_layout} → {vectorstore.layout()}")
+migrated = vectorstore.migrate_legacy_collection()
+if migrated:
+    print(f"✅ {migrated} perfiles migrados a {SHARD_STRATEGY} shards")
 
 # 3. RE-RANKER
 try:
@@ -159,7 +714,12 @@ def apply_filters(docs: List[Document], filters: Dict) -> List[Document]:
                 continue
         
         if 'maxDistance' in filters:
-            if metadata.get('location', {}).get('distance', 999) > filters['maxDistance']:
+            if get_location(metadata).get('distance', 999) > filters['maxDistance']:
+                continue
+        
+        if 'city' in filters and filters['city']:
+            cities = [filters['city']] if isinstance(filters['city'], str) else filters['city']
+            if slugify(get_location(metadata).get('city', '')) not in {slugify(c) for c in cities}:
                 continue
         
         if 'workMode' in filters and filters['workMode']:
@@ -170,16 +730,22 @@ def apply_filters(docs: List[Document], filters: Dict) -> List[Document]:
     
     return filtered
 
-def rerank_documents(query: str, docs: List[Document]) -> List[Document]:
-    """Re-rankea documentos usando cross-encoder"""
+def rerank_documents(query: str, docs: List[Document], max_pairs: Optional[int] = None) -> List[Document]:
+    """
+    Re-rankea documentos usando cross-encoder.
+    Con max_pairs sólo se re-rankean los primeros candidatos; el resto conserva el orden vectorial.
+    """
     if not reranker or not docs:
         return docs
     
+    head, tail = (docs, []) if max_pairs is None else (docs[:max_pairs], docs[max_pairs:])
     try:
-        pairs = [[query, doc.page_content] for doc in docs]
+        started = time.monotonic()
+        pairs = [[query, doc.page_content] for doc in head]
         scores = reranker.predict(pairs)
-        ranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
-        return [doc for doc, score in ranked]
+        load_monitor.record_rerank(len(pairs), time.monotonic() - started)
+        ranked = sorted(zip(head, scores), key=lambda x: x[1], reverse=True)
+        return [doc for doc, score in ranked] + tail
     except Exception as e:
         print(f"⚠️ Error en re-ranking: {e}")
         return docs
@@ -220,131 +786,1228 @@ def generate_response(query: str, docs: List[Document]) -> str:
     
     return response
 
-def get_cache_key(query: str, filters: Dict) -> str:
+def normalize_query(query: str) -> str:
+    """Normaliza la query: minúsculas, sin acentos, espacios y orden de tokens"""
+    text = unicodedata.normalize('NFKD', query.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    # Se conserva la puntuación interna ("c++", "c#", "node.js") y se quita la de los bordes
+    tokens = [t.strip('.,;:!?¿¡"\'()') for t in text.split()]
+    return ' '.join(sorted(t for t in tokens if t))
+
+def get_filters_key(filters: Dict, top_k: int) -> str:
+    """Serializa filtros y top_k de forma canónica (dos búsquedas sólo comparten resultados si coinciden)"""
+    return f"{json.dumps(filters or {}, sort_keys=True)}_{top_k}"
+
+def get_cache_key(query: str, filters: Dict, top_k: int = 5) -> str:
     """Genera key única para caché"""
-    cache_data = f"{query}_{json.dumps(filters, sort_keys=True)}"
+    cache_data = f"{normalize_query(query)}_{get_filters_key(filters, top_k)}"
     return hashlib.md5(cache_data.encode()).hexdigest()
 
+class SemanticQueryCache:
+    """
+    Índice en memoria de embeddings de queries ya cacheadas.
+    Permite servir paráfrasis de una búsqueda previa con los mismos filtros.
+    """
+
+    def __init__(self, threshold: float, max_entries: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # filters_key -> {cache_key: vector normalizado}
+        self._entries: Dict[str, Dict[str, np.ndarray]] = {}
+        # Orden LRU global de (filters_key, cache_key), el menos usado primero
+        self._lru: OrderedDict = OrderedDict()
+        self._exact_hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+        # Histograma de la mejor similitud encontrada en cada búsqueda semántica (10 tramos de 0.1)
+        self._similarity_hist = [0] * 10
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def lookup(self, vector, filters_key: str) -> Optional[Tuple[str, float]]:
+        """Devuelve (cache_key, similitud) del vecino más cercano si supera el umbral"""
+        vec = self._normalize(vector)
+        with self._lock:
+            bucket = self._entries.get(filters_key)
+            if not bucket:
+                return None
+            keys = list(bucket.keys())
+            matrix = np.vstack(list(bucket.values()))
+
+        sims = matrix @ vec
+        best = int(np.argmax(sims))
+        similarity = float(sims[best])
+
+        with self._lock:
+            self._similarity_hist[min(max(int(similarity * 10), 0), 9)] += 1
+
+        if similarity >= self.threshold:
+            self.touch(keys[best], filters_key)
+            return keys[best], similarity
+        return None
+
+    def touch(self, cache_key: str, filters_key: str):
+        """Marca una entrada como usada recientemente"""
+        with self._lock:
+            if (filters_key, cache_key) in self._lru:
+                self._lru.move_to_end((filters_key, cache_key))
+
+    def _remove(self, filters_key: str, cache_key: str):
+        bucket = self._entries.get(filters_key)
+        if bucket is not None:
+            bucket.pop(cache_key, None)
+            if not bucket:
+                del self._entries[filters_key]
+
+    def add(self, cache_key: str, filters_key: str, vector):
+        """Registra una query cacheada; descarta la menos usada si se supera el máximo"""
+        vec = self._normalize(vector)
+        with self._lock:
+            self._entries.setdefault(filters_key, {})[cache_key] = vec
+            self._lru[(filters_key, cache_key)] = None
+            self._lru.move_to_end((filters_key, cache_key))
+
+            while len(self._lru) > self.max_entries:
+                (oldest_filters, oldest_key), _ = self._lru.popitem(last=False)
+                self._remove(oldest_filters, oldest_key)
+
+    def discard(self, cache_key: str, filters_key: str):
+        """Elimina una entrada cuyo archivo de caché ya no existe"""
+        with self._lock:
+            if (filters_key, cache_key) in self._lru:
+                del self._lru[(filters_key, cache_key)]
+                self._remove(filters_key, cache_key)
+
+    def record_exact_hit(self):
+        with self._lock:
+            self._exact_hits += 1
+
+    def record_semantic_hit(self):
+        with self._lock:
+            self._semantic_hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self._misses += 1
+
+    def clear(self):
+        """Vacía el índice (las métricas se conservan)"""
+        with self._lock:
+            self._entries.clear()
+            self._lru.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self._exact_hits + self._semantic_hits + self._misses
+            return {
+                "entries": len(self._lru),
+                "threshold": self.threshold,
+                "exact_hits": self._exact_hits,
+                "semantic_hits": self._semantic_hits,
+                "misses": self._misses,
+                "hit_rate": round((self._exact_hits + self._semantic_hits) / total, 4) if total else 0.0,
+                "similarity_distribution": {
+                    f"{i / 10:.1f}-{(i + 1) / 10:.1f}": count
+                    for i, count in enumerate(self._similarity_hist)
+                },
+            }
+
+semantic_cache = SemanticQueryCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES)
+
+def load_cached_response(cache_file: str) -> Optional[Dict]:
+    """Lee una respuesta cacheada; None si el archivo no existe"""
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def adapt_cached_response(cached_response: Dict, query: str) -> Dict:
+    """Adapta una respuesta cacheada a la query actual (puede venir de una query equivalente)"""
+    docs = [Document(page_content="", metadata=p) for p in cached_response.get("professionals", [])]
+    return {
+        **cached_response,
+        "response": generate_response(query, docs),
+        "query": query,
+        "cached": True,
+    }
+
+def save_cached_response(cache_file: str, response_data: Dict):
+    """Escribe la respuesta en un archivo temporal y lo renombra (escritura atómica)"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = f"{cache_file}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(response_data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, cache_file)
+
+class LoadMonitor:
+    """
+    Señal de carga del servidor: búsquedas en curso y coste medio (EWMA)
+    del cross-encoder por par query-documento.
+    """
+
+    def __init__(self, high_watermark: int, initial_pair_cost: float = 0.01, alpha: float = 0.2):
+        self.high_watermark = max(high_watermark, 1)
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._pair_cost = initial_pair_cost
+
+    @contextmanager
+    def track(self):
+        """Cuenta la búsqueda como en curso mientras dura el bloque"""
+        with self._lock:
+            self._inflight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def record_rerank(self, pairs: int, elapsed: float):
+        if pairs <= 0:
+            return
+        with self._lock:
+            self._pair_cost = self.alpha * (elapsed / pairs) + (1 - self.alpha) * self._pair_cost
+
+    def load(self) -> float:
+        """Búsquedas en curso relativas al umbral (>= 1.0 significa servidor cargado)"""
+        with self._lock:
+            return self._inflight / self.high_watermark
+
+    def max_rerank_pairs(self, remaining: float) -> int:
+        """Pares que el cross-encoder puede procesar en el tiempo restante"""
+        with self._lock:
+            return int(remaining / self._pair_cost) if self._pair_cost > 0 else 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "inflight_searches": self._inflight,
+                "high_watermark": self.high_watermark,
+                "rerank_ms_per_pair": round(self._pair_cost * 1000, 3),
+            }
+
+load_monitor = LoadMonitor(LOAD_HIGH_WATERMARK)
+
+# Fracción del tiempo restante que puede consumir el re-ranking (el resto cubre
+# la generación de la respuesta y la serialización)
+RERANK_BUDGET_FRACTION = 0.8
+
+def plan_candidates(top_k: int, load: float, deadline: Optional[float] = None) -> Tuple[int, List[str]]:
+    """
+    Decide cuántos candidatos recuperar según la carga del servidor y el tiempo restante:
+    no tiene sentido recuperar más candidatos de los que el re-ranker podrá puntuar.
+    """
+    k = top_k * 2
+    if load >= 1.0:
+        k = top_k
+    if deadline is not None:
+        remaining = (deadline - time.monotonic()) * RERANK_BUDGET_FRACTION
+        affordable = load_monitor.max_rerank_pairs(remaining) if remaining > 0 else 0
+        k = min(k, max(affordable, top_k))
+    return k, (["reduced_candidates"] if k < top_k * 2 else [])
+
+def rerank_within_budget(query: str, docs: List[Document], deadline: Optional[float],
+                         load: float) -> Tuple[List[Document], List[str]]:
+    """Re-rankea respetando el deadline; omite o trunca el re-ranking si no alcanza el tiempo"""
+    if not reranker or not docs:
+        return docs, []
+
+    if load >= 2.0:
+        return docs, ["rerank_skipped"]
+
+    if deadline is None:
+        return rerank_documents(query, docs), []
+
+    remaining = (deadline - time.monotonic()) * RERANK_BUDGET_FRACTION
+    max_pairs = load_monitor.max_rerank_pairs(remaining) if remaining > 0 else 0
+    if max_pairs < 2:
+        return docs, ["rerank_skipped"]
+    if max_pairs < len(docs):
+        return rerank_documents(query, docs, max_pairs), ["rerank_truncated"]
+    return rerank_documents(query, docs), []
+
+# Generación del caché: cambia en cada invalidación. Una búsqueda iniciada antes de un
+# cambio en el corpus no guarda su resultado (podría incluir perfiles ya borrados)
+_cache_generation = 0
+_cache_generation_lock = threading.Lock()
+
+def cache_generation() -> int:
+    return _cache_generation
+
+def invalidate_search_cache():
+    """Descarta las respuestas cacheadas (tras cambios en el corpus o a petición)"""
+    global _cache_generation
+    with _cache_generation_lock:
+        _cache_generation += 1
+        if os.path.exists(CACHE_DIR):
+            for file in os.listdir(CACHE_DIR):
+                # Los temporales pertenecen a escrituras en curso que los renombrarán
+                if not file.endswith('.tmp'):
+                    os.remove(os.path.join(CACHE_DIR, file))
+        semantic_cache.clear()
+    cache_warmer.schedule()
+
+def cache_search_result(generation: int, cache_file: str, cache_key: str, filters_key: str,
+                        query_vector, response_data: Dict) -> bool:
+    """Guarda el resultado sólo si el caché no se invalidó desde que empezó la búsqueda"""
+    with _cache_generation_lock:
+        if generation != _cache_generation:
+            return False
+        save_cached_response(cache_file, response_data)
+        semantic_cache.add(cache_key, filters_key, query_vector)
+        return True
+
+_compaction_lock = threading.Lock()
+
+def compact_if_needed(force: bool = False) -> Optional[Dict]:
+    """Compacta el índice si la proporción de borrados supera el umbral (una compactación a la vez)"""
+    if not force and vectorstore.tombstone_stats()["dead_ratio"] < COMPACTION_THRESHOLD:
+        return None
+    if not _compaction_lock.acquire(blocking=False):
+        return None
+    try:
+        result = vectorstore.compact()
+        if result["removed"]:
+            print(f"🧹 Compactación: {result['removed']} perfiles eliminados en {len(result['rebuilt_shards'])} particiones")
+        return result
+    finally:
+        _compaction_lock.release()
+
+# ==================== COLA DE INDEXACIÓN ====================
+
+class IndexingQueue:
+    """
+    Cola de indexación en segundo plano.
+    Un único worker agrupa los perfiles encolados en lotes de embeddings y los
+    escribe cuando se alcanza el tamaño de lote o el intervalo de flush.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_jobs: int = 1000):
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_jobs = max_jobs
+        self._cond = threading.Condition()
+        self._pending = []  # (seq, job_id, profile_dict)
+        self._oldest_pending = None
+        self._enqueued_seq = 0
+        self._written_seq = 0
+        self._flush_requested = False
+        self._jobs: OrderedDict = OrderedDict()
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="indexing-worker", daemon=True)
+            self._worker.start()
+
+    def submit(self, profiles: List[Dict]) -> str:
+        """Encola perfiles y devuelve el id del job"""
+        job_id = uuid.uuid4().hex
+        with self._cond:
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "total": len(profiles),
+                "indexed": 0,
+                "error": None,
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+            self._trim_jobs()
+            for profile in profiles:
+                self._enqueued_seq += 1
+                self._pending.append((self._enqueued_seq, job_id, profile))
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            self._ensure_worker()
+            self._cond.notify_all()
+        return job_id
+
+    def _trim_jobs(self):
+        """Descarta los jobs terminados más antiguos si se supera el máximo"""
+        while len(self._jobs) > self.max_jobs:
+            for job_id, job in self._jobs.items():
+                if job["status"] in ("done", "failed"):
+                    del self._jobs[job_id]
+                    break
+            else:
+                return
+
+    def job(self, job_id: str) -> Optional[Dict]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Escribe ya lo encolado hasta ahora y espera a que sea durable. False si vence el timeout"""
+        with self._cond:
+            target = self._enqueued_seq
+            if self._written_seq >= target:
+                return True
+            self._flush_requested = True
+            self._ensure_worker()
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._written_seq >= target, timeout=timeout)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "active_jobs": sum(1 for job in self._jobs.values() if job["status"] in ("queued", "processing")),
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+            }
+
+    def _ready(self) -> bool:
+        if not self._pending:
+            return False
+        return (
+            self._flush_requested
+            or len(self._pending) >= self.batch_size
+            or time.monotonic() - self._oldest_pending >= self.flush_interval
+        )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready():
+                    wait = None
+                    if self._pending:
+                        wait = max(self.flush_interval - (time.monotonic() - self._oldest_pending), 0.01)
+                    self._cond.wait(timeout=wait)
+                items, self._pending = self._pending, []
+                self._oldest_pending = None
+                self._flush_requested = False
+                for job_id in {job_id for _, job_id, _ in items}:
+                    if job_id in self._jobs:
+                        self._jobs[job_id]["status"] = "processing"
+
+            self._write(items)
+
+    def _write(self, items: List[Tuple[int, str, Dict]]):
+        # Si un perfil aparece varias veces sólo se indexa la versión más reciente
+        latest = {}
+        for seq, job_id, profile in items:
+            latest[profile['id']] = profile
+
+        errors = {}
+        profiles = list(latest.values())
+        for start in range(0, len(profiles), self.batch_size):
+            chunk = profiles[start:start + self.batch_size]
+            try:
+                vectorstore.add_documents([
+                    Document(page_content=create_profile_document(p), metadata=flatten_metadata(p))
+                    for p in chunk
+                ])
+            except Exception as e:
+                print(f"⚠️ Error en indexación: {e}")
+                for p in chunk:
+                    errors[p['id']] = str(e)
+
+        if len(errors) < len(profiles):
+            try:
+                invalidate_search_cache()
+            except OSError as e:
+                print(f"⚠️ Error al invalidar caché: {e}")
+
+        # Todos los perfiles de un job se encolan juntos, así que se resuelven en esta misma escritura
+        failed = {}
+        for _, job_id, profile in items:
+            if profile['id'] in errors:
+                failed.setdefault(job_id, errors[profile['id']])
+
+        with self._cond:
+            for job_id in {job_id for _, job_id, _ in items}:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job["status"] = "failed" if job_id in failed else "done"
+                job["error"] = failed.get(job_id)
+                job["indexed"] = sum(
+                    1 for _, j, p in items if j == job_id and p['id'] not in errors
+                ) if job_id in failed else job["total"]
+                job["finished_at"] = time.time()
+            self._written_seq = max(seq for seq, _, _ in items)
+            self._cond.notify_all()
+
+indexing_queue = IndexingQueue(INDEX_BATCH_SIZE, INDEX_FLUSH_INTERVAL)
+
+# ==================== SNAPSHOTS ====================
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,99}$')
+SNAPSHOT_BATCH_SIZE = 1000
+
+# Similitud mínima entre el embedding de control del snapshot y el del modelo actual.
+# Tolera diferencias numéricas entre CPUs o builds de torch/BLAS, no un modelo distinto.
+SNAPSHOT_PROBE_MIN_SIMILARITY = 0.9999
+SNAPSHOT_PROBE_TEXT = "talenthub snapshot probe"
+
+@lru_cache(maxsize=1)
+def model_probe() -> Tuple[float, ...]:
+    """Embedding de una frase de control: identifica el modelo junto con su nombre"""
+    return tuple(float(x) for x in embeddings.embed_query(SNAPSHOT_PROBE_TEXT))
+
+def same_embedding_model(manifest: Dict) -> bool:
+    if manifest.get("model_name") != EMBEDDING_MODEL:
+        return False
+    stored = np.asarray(manifest.get("model_probe", []), dtype=np.float64)
+    current = np.asarray(model_probe(), dtype=np.float64)
+    if stored.shape != current.shape:
+        return False
+    norms = np.linalg.norm(stored) * np.linalg.norm(current)
+    return norms > 0 and float(stored @ current / norms) >= SNAPSHOT_PROBE_MIN_SIMILARITY
+
+def snapshot_path(name: str) -> str:
+    """Ruta de un snapshot validando el nombre (evita rutas fuera de SNAPSHOT_DIR)"""
+    if not SNAPSHOT_NAME_PATTERN.match(name):
+        raise ValueError(f"Nombre de snapshot inválido: {name}")
+    return os.path.join(SNAPSHOT_DIR, name)
+
+def corpus_hash(ids: List[str], matrix: np.ndarray) -> str:
+    """Hash de ids + embeddings, por bloques para no copiar en memoria una matriz mapeada"""
+    digest = hashlib.sha256(json.dumps(ids).encode())
+    for start in range(0, len(matrix), SNAPSHOT_BATCH_SIZE):
+        digest.update(np.ascontiguousarray(matrix[start:start + SNAPSHOT_BATCH_SIZE]).tobytes())
+    return digest.hexdigest()
+
+def export_snapshot(name: Optional[str] = None) -> Dict:
+    """
+    Escribe un snapshot versionado del índice:
+    manifest.json (modelo, dimensiones, hash), embeddings.npy y records.json (ids, textos, metadata).
+    """
+    name = name or time.strftime("snapshot-%Y%m%d-%H%M%S")
+    target = snapshot_path(name)
+    if os.path.exists(target):
+        raise FileExistsError(f"El snapshot {name} ya existe")
+
+    ids, matrix, documents, metadatas = vectorstore.export_data()
+    dimension = len(embeddings.embed_query("dimension")) if matrix.size == 0 else int(matrix.shape[1])
+    matrix = matrix.reshape(len(ids), dimension)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "name": name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "model_name": EMBEDDING_MODEL,
+        "model_probe": list(model_probe()),
+        "dimension": dimension,
+        "count": len(ids),
+        "corpus_hash": corpus_hash(ids, matrix),
+    }
+
+    # Se escribe en un directorio temporal y se renombra: nunca queda un snapshot a medias
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp_dir = os.path.join(SNAPSHOT_DIR, f".{name}.tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, "embeddings.npy"), matrix)
+    with open(os.path.join(tmp_dir, "records.json"), 'w', encoding='utf-8') as f:
+        json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f, ensure_ascii=False)
+    with open(os.path.join(tmp_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.rename(tmp_dir, target)
+
+    return manifest
+
+def read_snapshot_manifest(name: str) -> Dict:
+    with open(os.path.join(snapshot_path(name), "manifest.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def list_snapshots() -> List[Dict]:
+    if not os.path.exists(SNAPSHOT_DIR):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(SNAPSHOT_DIR)):
+        if name.startswith('.'):
+            continue
+        try:
+            manifests.append(read_snapshot_manifest(name))
+        except (OSError, ValueError):
+            continue
+    return manifests
+
+def import_snapshot(name: str) -> Dict:
+    """
+    Reemplaza el índice con un snapshot. Los embeddings se leen con memory-mapping
+    y se insertan tal cual: no se recalcula ningún embedding.
+    """
+    manifest = read_snapshot_manifest(name)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Versión de snapshot no soportada: {manifest.get('format_version')}")
+    if not same_embedding_model(manifest):
+        raise ValueError(
+            f"El snapshot se generó con otro modelo de embeddings ({manifest.get('model_name')})"
+        )
+
+    path = snapshot_path(name)
+    matrix = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')
+    with open(os.path.join(path, "records.json"), 'r', encoding='utf-8') as f:
+        records = json.load(f)
+
+    ids = records["ids"]
+    if len(ids) != manifest["count"] or corpus_hash(ids, matrix) != manifest["corpus_hash"]:
+        raise ValueError(f"El snapshot {name} está dañado (hash o número de perfiles no coinciden)")
+
+    vectorstore.replace_all(
+        (
+            ids[start:start + SNAPSHOT_BATCH_SIZE],
+            matrix[start:start + SNAPSHOT_BATCH_SIZE],
+            records["documents"][start:start + SNAPSHOT_BATCH_SIZE],
+            records["metadatas"][start:start + SNAPSHOT_BATCH_SIZE],
+        )
+        for start in range(0, len(ids), SNAPSHOT_BATCH_SIZE)
+    )
+    invalidate_search_cache()
+
+    return manifest
+
+# ==================== PIPELINE DE BÚSQUEDA ====================
+
+def execute_search(request: QueryRequest, deadline: Optional[float] = None) -> Dict:
+    """Caché + búsqueda vectorial + filtros + re-ranking (bloqueante, se ejecuta en el threadpool)"""
+    generation = cache_generation()
+
+    # Verificar caché (query normalizada)
+    filters_key = get_filters_key(request.filters, request.top_k)
+    cache_key = get_cache_key(request.query, request.filters, request.top_k)
+    cache_file = f"{CACHE_DIR}/{cache_key}.json"
+
+    cached_response = load_cached_response(cache_file)
+    if cached_response is not None:
+        semantic_cache.record_exact_hit()
+        semantic_cache.touch(cache_key, filters_key)
+        return adapt_cached_response(cached_response, request.query)
+
+    # Verificar caché semántico (paráfrasis con los mismos filtros)
+    query_vector = embeddings.embed_query(request.query)
+    match = semantic_cache.lookup(query_vector, filters_key)
+    if match:
+        similar_key, _ = match
+        cached_response = load_cached_response(f"{CACHE_DIR}/{similar_key}.json")
+        if cached_response is not None:
+            semantic_cache.record_semantic_hit()
+            return adapt_cached_response(cached_response, request.query)
+        semantic_cache.discard(similar_key, filters_key)
+
+    semantic_cache.record_miss()
+
+    # Número de candidatos según la carga actual
+    load = load_monitor.load()
+    k, degradations = plan_candidates(request.top_k, load, deadline)
+
+    # Búsqueda vectorial (reutiliza el embedding de la query)
+    docs = vectorstore.similarity_search_by_vector(query_vector, k=k, filters=request.filters)
+
+    # Aplicar filtros
+    docs = apply_filters(docs, request.filters)
+
+    # Re-ranking dentro del presupuesto de latencia
+    docs, rerank_degradations = rerank_within_budget(request.query, docs, deadline, load)
+    degradations += rerank_degradations
+
+    # Limitar a top_k
+    docs = docs[:request.top_k]
+
+    # Generar respuesta
+    response_text = generate_response(request.query, docs)
+
+    # Extraer profesionales
+    professionals = [doc.metadata for doc in docs]
+
+    # Preparar respuesta
+    response_data = {
+        "response": response_text,
+        "professionals": professionals,
+        "query": request.query,
+        "cached": False,
+        "degradations": degradations
+    }
+
+    # Guardar en caché (sólo resultados completos: uno degradado no debe servirse después,
+    # y tampoco uno calculado antes de un cambio en el corpus)
+    if not degradations:
+        cache_search_result(generation, cache_file, cache_key, filters_key, query_vector, response_data)
+
+    return response_data
+
+# ==================== PAGINACIÓN ====================
+
+class RankedCursor:
+    """
+    Ranking de una búsqueda paginada guardado en el servidor.
+    Los candidatos se puntúan con el cross-encoder sólo a medida que las páginas los exponen.
+    """
+
+    def __init__(self, query: str, page_size: int, candidates: List[Document]):
+        self.query = query
+        self.page_size = page_size
+        self.candidates = candidates
+        self.scores: List[float] = []
+        self.served = set()
+        self.page = 0
+        self.lock = threading.Lock()
+        self.size_bytes = sum(
+            len(doc.page_content) + len(json.dumps(doc.metadata, ensure_ascii=False))
+            for doc in candidates
+        )
+
+    def _score(self, start: int, end: int) -> List[float]:
+        if not reranker:
+            # Sin re-ranker se conserva el orden vectorial
+            return [-float(i) for i in range(start, end)]
+        started = time.monotonic()
+        pairs = [[self.query, doc.page_content] for doc in self.candidates[start:end]]
+        scores = [float(score) for score in reranker.predict(pairs)]
+        load_monitor.record_rerank(len(pairs), time.monotonic() - started)
+        return scores
+
+    def _is_deleted(self, index: int) -> bool:
+        return vectorstore.is_deleted(str(self.candidates[index].metadata.get('id', '')))
+
+    def next_page(self) -> List[Document]:
+        """Siguiente página: mejores candidatos puntuados aún no servidos"""
+        with self.lock:
+            # Como en la búsqueda normal, se puntúa una página de margen (page_size * 2 la primera vez)
+            window = min(len(self.candidates), (self.page + 2) * self.page_size)
+            while True:
+                if window > len(self.scores):
+                    self.scores.extend(self._score(len(self.scores), window))
+
+                remaining = [
+                    i for i in range(window)
+                    if i not in self.served and not self._is_deleted(i)
+                ]
+                # Si hay perfiles borrados en la ventana se amplía para completar la página
+                if len(remaining) >= self.page_size or window == len(self.candidates):
+                    break
+                window = min(len(self.candidates), window + self.page_size)
+
+            remaining.sort(key=lambda i: self.scores[i], reverse=True)
+            page = remaining[:self.page_size]
+
+            self.served.update(page)
+            self.page += 1
+            return [self.candidates[i] for i in page]
+
+    @property
+    def has_more(self) -> bool:
+        """Quedan candidatos vivos sin servir (los borrados después de la primera página no cuentan)"""
+        with self.lock:
+            return any(
+                i not in self.served and not self._is_deleted(i)
+                for i in range(len(self.candidates))
+            )
+
+class CursorStore:
+    """Cursores de paginación con TTL y límite de memoria (se descartan los menos usados)"""
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cursors: OrderedDict = OrderedDict()  # token -> (expira, RankedCursor)
+        self._bytes = 0
+
+    def _evict_expired(self, now: float):
+        for token in [t for t, (expires, _) in self._cursors.items() if expires <= now]:
+            self._bytes -= self._cursors.pop(token)[1].size_bytes
+
+    def put(self, cursor: RankedCursor) -> str:
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._cursors[token] = (now + self.ttl, cursor)
+            self._bytes += cursor.size_bytes
+            while len(self._cursors) > self.max_entries or (self._bytes > self.max_bytes and len(self._cursors) > 1):
+                self._bytes -= self._cursors.popitem(last=False)[1][1].size_bytes
+        return token
+
+    def get(self, token: str) -> Optional[RankedCursor]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._cursors.get(token)
+            if entry is None:
+                return None
+            self._cursors[token] = (now + self.ttl, entry[1])
+            self._cursors.move_to_end(token)
+            return entry[1]
+
+    def discard(self, token: str):
+        with self._lock:
+            entry = self._cursors.pop(token, None)
+            if entry:
+                self._bytes -= entry[1].size_bytes
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"cursors": len(self._cursors), "memory_bytes": self._bytes}
+
+cursor_store = CursorStore(CURSOR_TTL, CURSOR_MAX_ENTRIES, CURSOR_MAX_MEMORY_MB * 1024 * 1024)
+
+def build_page_response(cursor: RankedCursor, token: Optional[str], docs: List[Document]) -> Dict:
+    has_more = cursor.has_more
+    if not has_more and token:
+        cursor_store.discard(token)
+    return {
+        "response": generate_response(cursor.query, docs),
+        "professionals": [doc.metadata for doc in docs],
+        "query": cursor.query,
+        "page": cursor.page,
+        "cursor": token if has_more else None,
+        "has_more": has_more,
+        "total_candidates": len(cursor.candidates),
+    }
+
+def start_paged_search(request: PagedQueryRequest) -> Dict:
+    """Calcula la lista profunda de candidatos, la guarda bajo un cursor y devuelve la página 1"""
+    query_vector = embeddings.embed_query(request.query)
+    docs = vectorstore.similarity_search_by_vector(query_vector, k=PAGED_SEARCH_DEPTH, filters=request.filters)
+    docs = apply_filters(docs, request.filters)
+
+    cursor = RankedCursor(request.query, max(request.page_size, 1), docs)
+    page = cursor.next_page()
+    token = cursor_store.put(cursor) if cursor.has_more else None
+    return build_page_response(cursor, token, page)
+
+def continue_paged_search(token: str) -> Optional[Dict]:
+    """Sirve la siguiente página de un cursor; None si no existe o expiró"""
+    cursor = cursor_store.get(token)
+    if cursor is None:
+        return None
+    return build_page_response(cursor, token, cursor.next_page())
+
+# Búsquedas en curso por cache key: las peticiones idénticas simultáneas esperan a la primera
+_inflight_searches: Dict[str, asyncio.Future] = {}
+_coalesced_searches = 0
+
+async def coalesced_search(request: QueryRequest, deadline_ms: int = 0) -> Dict:
+    """
+    Single-flight: una sola ejecución del pipeline por cache key y deadline, compartida entre
+    peticiones. El deadline forma parte de la clave para que una petición sin límite no reciba
+    un resultado degradado por el presupuesto de otra.
+    """
+    global _coalesced_searches
+    deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+    flight_key = f"{get_cache_key(request.query, request.filters, request.top_k)}_{deadline_ms or 0}"
+
+    while flight_key in _inflight_searches:
+        future = _inflight_searches[flight_key]
+        try:
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Si se canceló la petición original (no ésta), se vuelve a intentar
+            if not future.cancelled():
+                raise
+            continue
+        _coalesced_searches += 1
+        # La clave es la query normalizada: la respuesta se adapta a la query de esta petición
+        return adapt_cached_response(result, request.query)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight_searches[flight_key] = future
+    try:
+        # Sólo cuenta como carga la petición que ejecuta el pipeline, no las que esperan
+        with load_monitor.track():
+            result = await run_in_threadpool(execute_search, request, deadline)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # evita el aviso de excepción no recuperada si nadie esperaba
+        raise
+    finally:
+        del _inflight_searches[flight_key]
+
+# ==================== REGISTRO DE QUERIES ====================
+
+def tail_lines(path: str, max_lines: int, block_size: int = 65536) -> List[str]:
+    """Últimas max_lines líneas de un archivo, leyendo bloques desde el final"""
+    if max_lines <= 0 or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        # Una línea más de las pedidas: la primera del bloque puede estar incompleta
+        while position > 0 and data.count(b'\n') <= max_lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    if position > 0:
+        lines = lines[1:]
+    return lines[-max_lines:]
+
+def read_query_log(path: str, max_entries: int) -> List[Dict]:
+    """
+    Lee las últimas max_entries entradas del registro (incluido el archivo rotado
+    si el actual no tiene suficientes); ignora líneas corruptas.
+    """
+    lines = tail_lines(path, max_entries)
+    if len(lines) < max_entries:
+        lines = tail_lines(f"{path}.1", max_entries - len(lines)) + lines
+
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries
+
+def top_logged_queries(entries: List[Dict], limit: int) -> List[Dict]:
+    """Búsquedas más frecuentes agrupadas por cache key (query normalizada + filtros + top_k)"""
+    counts: Dict[str, int] = {}
+    latest: Dict[str, Dict] = {}
+    for entry in entries:
+        key = entry.get("cache_key")
+        if not key:
+            continue
+        counts[key] = counts.get(key, 0) + 1
+        latest[key] = entry
+    ranked = sorted(counts, key=counts.get, reverse=True)[:limit]
+    return [{**latest[key], "count": counts[key]} for key in ranked]
+
+class QueryLog:
+    """
+    Registro append-only de búsquedas en JSON Lines.
+    Las entradas se encolan y las escribe un hilo en segundo plano, fuera del camino de la petición.
+    Al superar max_bytes el archivo se rota a <path>.1 (se conserva una sola rotación).
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._queue: queue.Queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._worker.start()
+
+    def record(self, entry: Dict):
+        self._queue.put(entry)
+
+    def flush(self):
+        """Espera a que todas las entradas encoladas estén escritas"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            entries = [self._queue.get()]
+            while not self._queue.empty():
+                entries.append(self._queue.get_nowait())
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    size = f.tell()
+                if self.max_bytes and size >= self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+            except OSError as e:
+                print(f"⚠️ Error al escribir el registro de queries: {e}")
+            finally:
+                for _ in entries:
+                    self._queue.task_done()
+
+query_log = QueryLog(QUERY_LOG_FILE, QUERY_LOG_MAX_MB * 1024 * 1024)
+
+def log_search(request: QueryRequest, response_data: Dict, latency: float):
+    professionals = response_data.get("professionals", [])
+    query_log.record({
+        "ts": time.time(),
+        "query": request.query,
+        "normalized_query": normalize_query(request.query),
+        "filters": request.filters or {},
+        "top_k": request.top_k,
+        "cache_key": get_cache_key(request.query, request.filters, request.top_k),
+        "latency_ms": round(latency * 1000, 2),
+        "cache_hit": bool(response_data.get("cached")),
+        "degradations": response_data.get("degradations", []),
+        "result_ids": [p.get("id") for p in professionals],
+    })
+
+class CacheWarmer:
+    """
+    Re-ejecuta en segundo plano las búsquedas más frecuentes del registro para
+    llenar el caché tras un arranque o un cambio en el corpus. Las peticiones de
+    calentamiento seguidas se agrupan en una sola pasada.
+    """
+
+    def __init__(self, top_n: int, delay: float):
+        self.top_n = top_n
+        self.delay = delay
+        self._requested = threading.Event()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.last_run: Optional[Dict] = None
+        # Event loop del servidor: el calentamiento pasa por el single-flight de las búsquedas
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def schedule(self):
+        if self.top_n <= 0:
+            return
+        with self._lock:
+            self._requested.set()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._requested.wait()
+            # Espera a que terminen las peticiones de calentamiento seguidas (p. ej. varios flush)
+            while self._requested.is_set():
+                self._requested.clear()
+                time.sleep(self.delay)
+            try:
+                self.warm()
+            except Exception as e:
+                print(f"⚠️ Error al calentar el caché: {e}")
+
+    def _search(self, request: QueryRequest) -> Dict:
+        """Ejecuta la búsqueda compartiendo el vuelo con peticiones de usuario idénticas"""
+        if self.loop is not None and self.loop.is_running():
+            return asyncio.run_coroutine_threadsafe(coalesced_search(request), self.loop).result()
+        return execute_search(request)
+
+    def warm(self) -> Dict:
+        started = time.monotonic()
+        entries = read_query_log(QUERY_LOG_FILE, max_entries=WARMUP_LOG_WINDOW)
+        warmed = 0
+        for entry in top_logged_queries(entries, self.top_n):
+            # Nuevos cambios en el corpus invalidarían este trabajo: se deja para la siguiente pasada
+            if self._requested.is_set():
+                break
+            # Las búsquedas de usuarios tienen prioridad
+            while load_monitor.load() >= 1.0:
+                time.sleep(0.5)
+            request = QueryRequest(query=entry["query"], filters=entry.get("filters") or {},
+                                   top_k=entry.get("top_k", 5))
+            if not self._search(request).get("cached"):
+                warmed += 1
+
+        self.last_run = {
+            "finished_at": time.time(),
+            "warmed_queries": warmed,
+            "duration_ms": round((time.monotonic() - started) * 1000, 2),
+        }
+        return self.last_run
+
+cache_warmer = CacheWarmer(WARMUP_QUERIES, WARMUP_DELAY)
+
 # ==================== ENDPOINTS ====================
 
+@app.on_event("startup")
+def load_startup_snapshot():
+    """Carga SNAPSHOT_ON_START si el índice está vacío (arranque rápido de réplicas)"""
+    if not SNAPSHOT_ON_START or vectorstore.count() > 0:
+        return
+    manifest = import_snapshot(SNAPSHOT_ON_START)
+    print(f"✅ Snapshot {manifest['name']} cargado: {manifest['count']} perfiles")
+
+@app.on_event("startup")
+async def schedule_startup_warmup():
+    """Calienta el caché con las búsquedas más frecuentes tras un despliegue"""
+    cache_warmer.loop = asyncio.get_running_loop()
+    cache_warmer.schedule()
+
+@app.on_event("shutdown")
+def flush_indexing_queue():
+    """No se pierden perfiles encolados al detener el servidor"""
+    indexing_queue.flush(timeout=60)
+
+@app.on_event("startup")
+async def schedule_startup_compaction():
+    """Compacta en segundo plano los borrados pendientes de una ejecución anterior"""
+    asyncio.get_running_loop().run_in_executor(None, compact_if_needed)
+
 @app.get("/")
 async def root():
     return {
         "service": "TalentHub RAG API",
         "status": "online",
         "version": "optimized",
-        "vectorstore_count": vectorstore._collection.count()
+        "vectorstore_count": vectorstore.count()
     }
 
 @app.post("/api/rag/search", response_model=QueryResponse)
-async def rag_search(request: QueryRequest):
+async def rag_search(request: QueryRequest, x_deadline_ms: Optional[int] = Header(None)):
     """
-    Endpoint principal de búsqueda RAG
+    Endpoint principal de búsqueda RAG.
+    El deadline (campo deadline_ms o cabecera X-Deadline-Ms) acota la latencia degradando el pipeline.
     """
+    deadline_ms = request.deadline_ms or x_deadline_ms or DEFAULT_DEADLINE_MS
+
     try:
-        # Verificar caché
-        cache_key = get_cache_key(request.query, request.filters)
-        cache_file = f"{CACHE_DIR}/{cache_key}.json"
-        
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cached_response = json.load(f)
-                cached_response['cached'] = True
-                return QueryResponse(**cached_response)
-        
-        # Búsqueda vectorial
-        docs = vectorstore.similarity_search(
-            request.query,
-            k=request.top_k * 2
-        )
-        
-        # Aplicar filtros
-        docs = apply_filters(docs, request.filters)
-        
-        # Re-ranking
-        docs = rerank_documents(request.query, docs)
-        
-        # Limitar a top_k
-        docs = docs[:request.top_k]
-        
-        # Generar respuesta
-        response_text = generate_response(request.query, docs)
-        
-        # Extraer profesionales
-        professionals = [doc.metadata for doc in docs]
-        
-        # Preparar respuesta
-        response_data = {
-            "response": response_text,
-            "professionals": professionals,
-            "query": request.query,
-            "cached": False
-        }
-        
-        # Guardar en caché
-        os.makedirs(CACHE_DIR, exist_ok=True)
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(response_data, f, ensure_ascii=False, indent=2)
-        
+        started = time.monotonic()
+        response_data = await coalesced_search(request, deadline_ms)
+        log_search(request, response_data, time.monotonic() - started)
         return QueryResponse(**response_data)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en búsqueda RAG: {str(e)}")
 
-@app.post("/api/profiles/index")
+async def flush_pending_indexing(timeout: float = INDEX_FLUSH_TIMEOUT):
+    """Espera a que se escriba la cola de indexación; 504 si no termina a tiempo"""
+    if not await run_in_threadpool(indexing_queue.flush, timeout):
+        raise HTTPException(status_code=504, detail="La indexación pendiente no terminó a tiempo")
+
+@app.post("/api/rag/search/paged", response_model=PagedQueryResponse)
+async def rag_search_paged(request: PagedQueryRequest):
+    """
+    Búsqueda paginada: devuelve la primera página y un cursor opaco para las siguientes.
+    El ranking se guarda en el servidor; las páginas siguientes no repiten la búsqueda.
+    """
+    try:
+        with load_monitor.track():
+            response_data = await run_in_threadpool(start_paged_search, request)
+        return PagedQueryResponse(**response_data)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en búsqueda paginada: {str(e)}")
+
+@app.post("/api/rag/search/next", response_model=PagedQueryResponse)
+async def rag_search_next(request: NextPageRequest):
+    """Siguiente página de una búsqueda paginada"""
+    try:
+        with load_monitor.track():
+            response_data = await run_in_threadpool(continue_paged_search, request.cursor)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en búsqueda paginada: {str(e)}")
+
+    if response_data is None:
+        raise HTTPException(status_code=404, detail="Cursor no encontrado o expirado")
+    return PagedQueryResponse(**response_data)
+
+@app.post("/api/profiles/index", status_code=202)
 async def index_profile(profile: ProfileIndexRequest):
-    """Indexa un nuevo perfil"""
+    """Encola un nuevo perfil para indexar"""
     try:
-        profile_dict = profile.dict()
-        text = create_profile_document(profile_dict)
-        
-        doc = Document(
-            page_content=text,
-            metadata=flatten_metadata(profile_dict) 
-        )
-        
-        vectorstore.add_documents([doc])
-        vectorstore.persist()
+        job_id = indexing_queue.submit([profile.dict()])
         
         return {
-            "status": "success",
-            "message": f"Perfil de {profile.name} indexado correctamente",
-            "profile_id": profile.id
+            "status": "queued",
+            "message": f"Perfil de {profile.name} encolado para indexar",
+            "profile_id": profile.id,
+            "job_id": job_id
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al indexar perfil: {str(e)}")
 
-@app.post("/api/profiles/index-batch")
+@app.post("/api/profiles/index-batch", status_code=202)
 async def index_profiles_batch(profiles: List[ProfileIndexRequest]):
-    """Indexa múltiples perfiles"""
+    """Encola múltiples perfiles para indexar"""
     try:
-        documents = []
-        for profile in profiles:
-            profile_dict = profile.dict()
-            text = create_profile_document(profile_dict)
-            doc = Document(page_content=text, metadata=flatten_metadata(profile_dict))
-            documents.append(doc)
-        
-        vectorstore.add_documents(documents)
-        vectorstore.persist()
+        job_id = indexing_queue.submit([profile.dict() for profile in profiles])
         
         return {
-            "status": "success",
-            "message": f"{len(profiles)} perfiles indexados correctamente"
+            "status": "queued",
+            "message": f"{len(profiles)} perfiles encolados para indexar",
+            "job_id": job_id
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al indexar perfiles: {str(e)}")
 
+@app.post("/api/profiles/flush")
+async def flush_indexing(timeout: float = INDEX_FLUSH_TIMEOUT):
+    """Escribe de inmediato los perfiles encolados y espera a que sean durables"""
+    await flush_pending_indexing(timeout)
+    return {"status": "success", "message": "Perfiles encolados indexados"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_indexing_job(job_id: str):
+    """Estado de un job de indexación"""
+    job = indexing_queue.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job no encontrado: {job_id}")
+    return job
+
+@app.put("/api/profiles/{profile_id}")
+async def update_profile(profile_id: int, profile: ProfileIndexRequest):
+    """Actualiza un perfil existente (reemplaza su documento en el índice)"""
+    if profile.id != profile_id:
+        raise HTTPException(status_code=400, detail="El id del perfil no coincide con la URL")
+
+    try:
+        # Las escrituras encoladas antes que ésta deben aplicarse primero
+        await flush_pending_indexing()
+        if await run_in_threadpool(vectorstore.get_document, str(profile_id)) is None:
+            raise HTTPException(status_code=404, detail=f"Perfil no encontrado: {profile_id}")
+
+        profile_dict = profile.dict()
+        doc = Document(
+            page_content=create_profile_document(profile_dict),
+            metadata=flatten_metadata(profile_dict)
+        )
+        await run_in_threadpool(vectorstore.add_documents, [doc])
+        invalidate_search_cache()
+
+        return {
+            "status": "success",
+            "message": f"Perfil de {profile.name} actualizado correctamente",
+            "profile_id": profile_id
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al actualizar perfil: {str(e)}")
+
+@app.delete("/api/profiles/{profile_id}")
+async def delete_profile(profile_id: int, background_tasks: BackgroundTasks):
+    """Borra un perfil: queda excluido de las búsquedas al instante y se elimina al compactar"""
+    try:
+        await flush_pending_indexing()
+        if not await run_in_threadpool(vectorstore.mark_deleted, str(profile_id)):
+            raise HTTPException(status_code=404, detail=f"Perfil no encontrado: {profile_id}")
+
+        invalidate_search_cache()
+        background_tasks.add_task(compact_if_needed)
+
+        return {
+            "status": "success",
+            "message": f"Perfil {profile_id} eliminado",
+            "profile_id": profile_id
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al eliminar perfil: {str(e)}")
+
+@app.post("/api/compact")
+async def compact_index():
+    """Fuerza la compactación del índice"""
+    try:
+        result = await run_in_threadpool(compact_if_needed, True)
+        if result is None:
+            return {"status": "skipped", "message": "Ya hay una compactación en curso"}
+        return {"status": "success", **result}
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al compactar: {str(e)}")
+
 @app.delete("/api/cache/clear")
 async def clear_cache():
     """Limpia el caché"""
     try:
-        if os.path.exists(CACHE_DIR):
-            for file in os.listdir(CACHE_DIR):
-                os.remove(os.path.join(CACHE_DIR, file))
-        
+        invalidate_search_cache()
+
         return {"status": "success", "message": "Caché limpiado"}
     
     except Exception as e:
@@ -354,11 +2017,72 @@ async def clear_cache():
 async def get_stats():
     """Estadísticas del sistema"""
     return {
-        "total_profiles": vectorstore._collection.count(),
+        "total_profiles": vectorstore.count(),
         "cache_size": len(os.listdir(CACHE_DIR)) if os.path.exists(CACHE_DIR) else 0,
+        "semantic_cache": semantic_cache.stats(),
+        "load": load_monitor.stats(),
+        "coalesced_searches": _coalesced_searches,
+        "pagination": cursor_store.stats(),
+        "cache_warmup": cache_warmer.last_run,
+        "shards": vectorstore.shard_counts(),
+        "tombstones": vectorstore.tombstone_stats(),
+        "indexing_queue": indexing_queue.stats(),
         "system_status": "optimized - no LLM required"
     }
 
+@app.get("/api/shards")
+async def list_shards():
+    """Lista las particiones del índice con su número de perfiles"""
+    return {
+        "strategy": vectorstore.strategy,
+        "shards": vectorstore.shard_counts()
+    }
+
+@app.post("/api/shards/{name}/rebuild")
+async def rebuild_shard(name: str):
+    """Reconstruye (compacta) una partición sin afectar al resto"""
+    try:
+        count = await run_in_threadpool(vectorstore.rebuild_shard, name)
+        return {"status": "success", "shard": name, "profiles": count}
+    
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Partición no encontrada: {name}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al reconstruir partición: {str(e)}")
+
+@app.get("/api/snapshots")
+async def get_snapshots():
+    """Lista los snapshots disponibles"""
+    return {"snapshots": list_snapshots()}
+
+@app.post("/api/snapshots/export")
+async def create_snapshot(request: SnapshotRequest):
+    """Exporta el índice a un snapshot versionado"""
+    try:
+        manifest = await run_in_threadpool(export_snapshot, request.name)
+        return {"status": "success", "snapshot": manifest}
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al exportar snapshot: {str(e)}")
+
+@app.post("/api/snapshots/{name}/import")
+async def load_snapshot(name: str):
+    """Reemplaza el índice con un snapshot sin recalcular embeddings"""
+    try:
+        manifest = await run_in_threadpool(import_snapshot, name)
+        return {"status": "success", "snapshot": manifest}
+    
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Snapshot no encontrado: {name}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al importar snapshot: {str(e)}")
+
 # ==================== INICIO ====================
 
 if __name__ == "__main__":
@@ -367,7 +2091,7 @@ if __name__ == "__main__":
     print("\n" + "="*50)
     print("🚀 TalentHub RAG Backend - OPTIMIZADO")
     print("="*50)
-    print(f"📊 Perfiles indexados: {vectorstore._collection.count()}")
+    print(f"📊 Perfiles indexados: {vectorstore.count()} en {len(vectorstore.shard_counts())} particiones ({SHARD_STRATEGY})")
     print(f"🎯 Re-ranker: {'✅ Disponible' if reranker else '❌ No configurado'}")
     print(f"⚡ Modo: Búsqueda vectorial pura (sin LLM)")
     print("\n📡 Servidor iniciando en http://localhost:8000")
@@ -0,0 +1,94 @@
+"""
+Analiza el registro de queries: búsquedas más frecuentes y latencias atípicas.
+
+Uso:
+    python -m scripts.analyze_query_log [--log ./logs/query_log.jsonl] [--top 20] [--outlier-ms 1000]
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+
+DEFAULT_LOG_FILE = os.getenv("QUERY_LOG_FILE", "./logs/query_log.jsonl")
+
+def load_entries(path):
+    """Lee el registro rotado (<path>.1), si existe, y después el actual"""
+    entries = []
+    for file in (f"{path}.1", path):
+        if not os.path.exists(file):
+            continue
+        with open(file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return entries
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+def main():
+    parser = argparse.ArgumentParser(description="Analiza el registro de queries de TalentHub")
+    parser.add_argument("--log", default=DEFAULT_LOG_FILE, help="Ruta del registro (JSON Lines)")
+    parser.add_argument("--top", type=int, default=20, help="Número de búsquedas frecuentes a mostrar")
+    parser.add_argument("--outlier-ms", type=float, default=None,
+                        help="Latencia a partir de la cual una búsqueda es atípica (por defecto, p99)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        print(f"❌ No existe el registro: {args.log}")
+        return
+
+    entries = load_entries(args.log)
+    if not entries:
+        print("⚠️  El registro está vacío")
+        return
+
+    latencies = [e.get("latency_ms", 0) for e in entries]
+    misses = [e.get("latency_ms", 0) for e in entries if not e.get("cache_hit")]
+    hits = sum(1 for e in entries if e.get("cache_hit"))
+
+    print("\n" + "="*60)
+    print(f"📊 {len(entries)} búsquedas registradas")
+    print("="*60)
+    print(f"   Cache hit rate: {hits / len(entries):.1%}")
+    print(f"   Latencia p50/p95/p99: {percentile(latencies, 50):.1f} / "
+          f"{percentile(latencies, 95):.1f} / {percentile(latencies, 99):.1f} ms")
+    if misses:
+        print(f"   Latencia sin caché p50/p95: {percentile(misses, 50):.1f} / {percentile(misses, 95):.1f} ms")
+
+    # Agrupar por query normalizada + filtros + top_k
+    groups = defaultdict(list)
+    for entry in entries:
+        key = entry.get("cache_key") or entry.get("query", "")
+        groups[key].append(entry)
+
+    print(f"\n🔝 Top {args.top} búsquedas")
+    ranked = sorted(groups.values(), key=len, reverse=True)[:args.top]
+    for i, group in enumerate(ranked, 1):
+        last = group[-1]
+        avg = sum(e.get("latency_ms", 0) for e in group) / len(group)
+        group_hits = sum(1 for e in group if e.get("cache_hit"))
+        filters = json.dumps(last.get("filters") or {}, ensure_ascii=False)
+        print(f"   {i:>2}. {len(group):>5}x  '{last.get('query', '')}'  filtros={filters}  "
+              f"top_k={last.get('top_k')}  media={avg:.1f} ms  hits={group_hits / len(group):.0%}")
+
+    threshold = args.outlier_ms if args.outlier_ms is not None else percentile(latencies, 99)
+    outliers = sorted((e for e in entries if e.get("latency_ms", 0) >= threshold),
+                      key=lambda e: e.get("latency_ms", 0), reverse=True)
+
+    print(f"\n🐢 Latencias atípicas (>= {threshold:.1f} ms): {len(outliers)}")
+    for entry in outliers[:args.top]:
+        degradations = ", ".join(entry.get("degradations") or []) or "-"
+        print(f"   {entry.get('latency_ms', 0):>9.1f} ms  '{entry.get('query', '')}'  "
+              f"cache={'sí' if entry.get('cache_hit') else 'no'}  degradaciones={degradations}")
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
+import sys
 import json
 from pathlib import Path
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import Chroma
-from langchain.schema import Document
+from langchain_core.documents import Document
+
+# Añadir directorio raíz al path
+sys.path.append(str(Path(__file__).parent.parent))
 
 # Configuración
 CHROMA_DB_DIR = "./chroma_db"
@@ -81,32 +83,16 @@ def main():
     os.makedirs("./cache", exist_ok=True)
     print("✅ Directorios creados\n")
     
-    # 2. Inicializar embeddings
-    print("🤖 Cargando modelo de embeddings...")
-    try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
-        )
-        print("✅ Modelo cargado\n")
-    except Exception as e:
-        print(f"❌ Error al cargar embeddings: {e}")
-        return
-    
-    # 3. Crear/conectar vector store
-    print("💾 Creando vector store...")
+    # 2. Cargar embeddings y conectar al vector store particionado de la API
+    print("🤖 Cargando modelo de embeddings y vector store...")
     try:
-        vectorstore = Chroma(
-            persist_directory=CHROMA_DB_DIR,
-            embedding_function=embeddings,
-            collection_name="talent_profiles"
-        )
-        print("✅ Vector store creado\n")
+        from main import vectorstore
+        print("✅ Vector store listo\n")
     except Exception as e:
         print(f"❌ Error al crear vector store: {e}")
         return
     
-    # 4. Cargar perfiles
+    # 3. Cargar perfiles
     print(f"📊 Cargando perfiles desde {DATA_FILE}...")
     
     if not os.path.exists(DATA_FILE):
@@ -172,7 +158,7 @@ def main():
             print(f"❌ Error al leer archivo: {e}")
             return
     
-    # 5. Procesar e indexar
+    # 4. Procesar e indexar
     print("🔧 Procesando y creando embeddings...")
     
     try:
@@ -184,7 +170,6 @@ def main():
         
         print(f"\n📥 Indexando {len(documents)} documentos...")
         vectorstore.add_documents(documents)
-        vectorstore.persist()
         
         print("✅ Indexación completada\n")
         
@@ -194,10 +179,10 @@ def main():
         traceback.print_exc()
         return
     
-    # 6. Verificar
+    # 5. Verificar
     print("🔍 Verificando indexación...")
     try:
-        count = vectorstore._collection.count()
+        count = vectorstore.count()
         print(f"✅ Total de documentos: {count}\n")
         
         print("🧪 Búsqueda de prueba...")
@@ -0,0 +1,45 @@
+"""
+Exporta o importa snapshots del índice vectorial.
+
+Uso:
+    python -m scripts.snapshot export [nombre]
+    python -m scripts.snapshot import <nombre>
+    python -m scripts.snapshot list
+"""
+
+import sys
+from pathlib import Path
+
+# Añadir directorio raíz al path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from main import export_snapshot, import_snapshot, list_snapshots
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("export", "import", "list"):
+        print(__doc__)
+        sys.exit(1)
+
+    command = sys.argv[1]
+    name = sys.argv[2] if len(sys.argv) > 2 else None
+
+    try:
+        if command == "export":
+            manifest = export_snapshot(name)
+            print(f"✅ Snapshot {manifest['name']} exportado: {manifest['count']} perfiles")
+        elif command == "import":
+            if not name:
+                print("❌ Indica el nombre del snapshot a importar")
+                sys.exit(1)
+            manifest = import_snapshot(name)
+            print(f"✅ Snapshot {manifest['name']} importado: {manifest['count']} perfiles")
+        else:
+            for manifest in list_snapshots():
+                print(f"📦 {manifest['name']}  {manifest['created_at']}  "
+                      f"{manifest['count']} perfiles  ({manifest['model_name']})")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
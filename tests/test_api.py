@@ -77,10 +77,11 @@ def test_profile_index():
     }
     
     response = client.post("/api/profiles/index", json=profile)
-    assert response.status_code == 200
+    assert response.status_code == 202
     data = response.json()
-    assert data["status"] == "success"
+    assert data["status"] == "queued"
     assert "profile_id" in data
+    assert "job_id" in data
 
 def test_stats():
     """Test del endpoint de estadísticas"""
@@ -145,7 +146,479 @@ def test_batch_indexing():
     ]
     
     response = client.post("/api/profiles/index-batch", json=profiles)
+    assert response.status_code == 202
+    data = response.json()
+    assert data["status"] == "queued"
+    assert "3 perfiles" in data["message"]
+
+def test_normalize_query():
+    """Test de normalización de queries para el caché"""
+    from main import normalize_query
+    assert normalize_query("desarrollador Python") == normalize_query("  Python   DESARROLLADOR ")
+    assert normalize_query("Diseñadora UX") == normalize_query("diseñadora ux")
+    assert normalize_query("Analista de Datos") == normalize_query("analista de datos")
+    assert normalize_query("C++") != normalize_query("C#")
+
+def test_cache_normalized_query():
+    """Test de acierto de caché con una query equivalente"""
+    client.delete("/api/cache/clear")
+    client.post("/api/rag/search", json={"query": "desarrollador Python", "top_k": 3})
+    response = client.post(
+        "/api/rag/search",
+        json={"query": "Python  DESARROLLADOR", "top_k": 3}
+    )
     assert response.status_code == 200
+    assert response.json()["cached"] is True
+
+def test_semantic_cache_paraphrase():
+    """Test de caché semántico: una paráfrasis reutiliza la búsqueda previa"""
+    client.delete("/api/cache/clear")
+    client.post("/api/rag/search", json={"query": "desarrollador Python", "top_k": 3})
+    response = client.post(
+        "/api/rag/search",
+        json={"query": "desarrolladores Python", "top_k": 3}
+    )
     data = response.json()
-    assert data["status"] == "success"
-    assert "3 perfiles" in data["message"]
\ No newline at end of file
+    assert data["cached"] is True
+    # La respuesta se refiere a la query que envió el usuario
+    assert data["query"] == "desarrolladores Python"
+    assert "desarrolladores Python" in data["response"] or not data["professionals"]
+
+def test_semantic_cache_different_skill():
+    """Test de caché semántico: otra tecnología no reutiliza resultados"""
+    client.delete("/api/cache/clear")
+    client.post("/api/rag/search", json={"query": "desarrollador Python", "top_k": 3})
+    response = client.post(
+        "/api/rag/search",
+        json={"query": "desarrollador Java", "top_k": 3}
+    )
+    assert response.json()["cached"] is False
+
+def test_semantic_cache_lru_eviction():
+    """Test de expulsión LRU global entre filtros distintos"""
+    from main import SemanticQueryCache
+    cache = SemanticQueryCache(threshold=0.9, max_entries=2)
+    cache.add("popular", "{}_5", [1.0, 0.0])
+    cache.add("other", '{"city": "X"}_5', [0.0, 1.0])
+    # Un acierto refresca la entrada popular
+    assert cache.lookup([1.0, 0.0], "{}_5")[0] == "popular"
+    cache.add("third", '{"city": "Y"}_5', [0.5, 0.5])
+    assert cache.lookup([1.0, 0.0], "{}_5")[0] == "popular"
+    assert cache.lookup([0.0, 1.0], '{"city": "X"}_5') is None
+
+def test_semantic_cache_stats():
+    """Test de métricas del caché semántico"""
+    response = client.get("/api/stats")
+    assert response.status_code == 200
+    stats = response.json()["semantic_cache"]
+    assert "hit_rate" in stats
+    assert "similarity_distribution" in stats
+
+def test_rag_search_with_deadline():
+    """Test de búsqueda con presupuesto de latencia mínimo"""
+    import main
+    client.delete("/api/cache/clear")
+    response = client.post(
+        "/api/rag/search",
+        json={"query": "ingeniero DevOps", "top_k": 3},
+        headers={"X-Deadline-Ms": "1"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["professionals"]) <= 3
+    if main.reranker is not None and data["professionals"]:
+        # 1 ms no alcanza para el cross-encoder
+        assert "rerank_skipped" in data["degradations"]
+        assert data["cached"] is False
+
+def test_plan_candidates_under_load():
+    """Test de reducción de candidatos con el servidor cargado o sin tiempo"""
+    import time
+    from main import plan_candidates
+    assert plan_candidates(5, 0.5) == (10, [])
+    assert plan_candidates(5, 1.5) == (5, ["reduced_candidates"])
+    # Con el deadline ya vencido sólo se recupera top_k
+    assert plan_candidates(5, 0.5, time.monotonic() - 1) == (5, ["reduced_candidates"])
+
+def test_list_shards():
+    """Test del listado de particiones"""
+    response = client.get("/api/shards")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["strategy"] in ["hash", "location"]
+    assert sum(data["shards"].values()) == client.get("/api/stats").json()["total_profiles"]
+
+def test_rebuild_unknown_shard():
+    """Test de reconstrucción de una partición inexistente"""
+    response = client.post("/api/shards/no_existe/rebuild")
+    assert response.status_code == 404
+
+def test_rag_search_with_city_filter():
+    """Test de búsqueda restringida a una ciudad"""
+    response = client.post(
+        "/api/rag/search",
+        json={
+            "query": "desarrollador",
+            "filters": {"city": "Test City"},
+            "top_k": 5
+        }
+    )
+    assert response.status_code == 200
+    for professional in response.json()["professionals"]:
+        assert "Test City" in professional["location"]
+
+def test_snapshot_export_import(tmp_path, monkeypatch):
+    """Test de exportación e importación de un snapshot"""
+    import main
+    monkeypatch.setattr(main, "SNAPSHOT_DIR", str(tmp_path))
+    name = "test-snapshot"
+    total = client.get("/api/stats").json()["total_profiles"]
+
+    response = client.post("/api/snapshots/export", json={"name": name})
+    assert response.status_code == 200
+    assert response.json()["snapshot"]["count"] == total
+
+    response = client.post(f"/api/snapshots/{name}/import")
+    assert response.status_code == 200
+    assert client.get("/api/stats").json()["total_profiles"] == total
+
+def test_snapshot_model_check():
+    """Test de verificación del modelo: tolera ruido numérico, no otro modelo"""
+    import numpy as np
+    from main import EMBEDDING_MODEL, model_probe, same_embedding_model
+    probe = np.asarray(model_probe())
+    noisy = probe + np.random.default_rng(0).normal(0, 1e-6, probe.shape)
+    assert same_embedding_model({"model_name": EMBEDDING_MODEL, "model_probe": noisy.tolist()})
+    assert not same_embedding_model({"model_name": EMBEDDING_MODEL, "model_probe": (-probe).tolist()})
+    assert not same_embedding_model({"model_name": "otro-modelo", "model_probe": probe.tolist()})
+
+def test_snapshot_invalid_name():
+    """Test de snapshot con nombre inválido"""
+    response = client.post("/api/snapshots/export", json={"name": "../fuera"})
+    assert response.status_code == 400
+
+def _test_profile(profile_id, title="Test Developer"):
+    return {
+        "id": profile_id,
+        "name": f"Test User {profile_id}",
+        "title": title,
+        "skills": ["Python"],
+        "location": {"city": "Test City", "distance": 5},
+        "workMode": ["Remoto"],
+        "experience": "3 años",
+        "certifications": [],
+        "description": "Test profile",
+        "salary": "3000",
+        "rating": 4.5,
+        "availability": "Inmediata"
+    }
+
+def test_update_profile():
+    """Test de actualización de perfil"""
+    client.post("/api/profiles/index", json=_test_profile(2000))
+    response = client.put("/api/profiles/2000", json=_test_profile(2000, title="Test Lead"))
+    assert response.status_code == 200
+    assert response.json()["profile_id"] == 2000
+
+    response = client.put("/api/profiles/2001", json=_test_profile(2000))
+    assert response.status_code == 400
+
+def test_delete_profile():
+    """Test de borrado de perfil con tombstone"""
+    client.post("/api/profiles/index", json=_test_profile(2002))
+    client.post("/api/profiles/flush")
+    total = client.get("/api/stats").json()["total_profiles"]
+
+    response = client.delete("/api/profiles/2002")
+    assert response.status_code == 200
+    assert client.get("/api/stats").json()["total_profiles"] == total - 1
+
+    response = client.post("/api/rag/search", json={"query": "Test User 2002", "top_k": 20})
+    assert all(p.get("id") != 2002 for p in response.json()["professionals"])
+
+    assert client.delete("/api/profiles/2002").status_code == 404
+    assert client.put("/api/profiles/2002", json=_test_profile(2002)).status_code == 404
+
+def test_tombstone_stats():
+    """Test de métricas de perfiles vivos/borrados"""
+    stats = client.get("/api/stats").json()["tombstones"]
+    assert set(stats) == {"live", "dead", "dead_ratio"}
+    assert client.post("/api/compact").status_code == 200
+    assert client.get("/api/stats").json()["tombstones"]["dead"] == 0
+
+def test_indexing_job_status():
+    """Test de job de indexación y flush"""
+    response = client.post("/api/profiles/index", json=_test_profile(2003))
+    job_id = response.json()["job_id"]
+
+    assert client.post("/api/profiles/flush").status_code == 200
+    job = client.get(f"/api/jobs/{job_id}").json()
+    assert job["status"] == "done"
+    assert job["indexed"] == 1
+
+    assert client.get("/api/jobs/no-existe").status_code == 404
+
+def test_coalesced_search(monkeypatch):
+    """Test de single-flight: búsquedas idénticas simultáneas ejecutan el pipeline una vez"""
+    import asyncio
+    import time
+    import main
+
+    calls = []
+
+    def slow_search(request, deadline):
+        calls.append(request.query)
+        time.sleep(0.2)
+        return {"response": "", "professionals": [], "query": request.query,
+                "cached": False, "degradations": []}
+
+    monkeypatch.setattr(main, "execute_search", slow_search)
+
+    queries = ["búsqueda popular", "Popular búsqueda", "búsqueda  POPULAR",
+               "popular búsqueda", "búsqueda popular"]
+
+    async def run():
+        requests = [main.QueryRequest(query=query, top_k=3) for query in queries]
+        return await asyncio.gather(*[main.coalesced_search(request) for request in requests])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sum(result["cached"] for result in results) == 4
+    # Cada petición recibe su propia query, aunque compartan ejecución
+    assert [result["query"] for result in results] == queries
+
+def test_coalesced_search_load_and_deadline(monkeypatch):
+    """Test de single-flight: las peticiones en espera no cuentan como carga y el deadline separa vuelos"""
+    import asyncio
+    import time
+    import main
+
+    loads = []
+
+    def slow_search(request, deadline):
+        time.sleep(0.2)
+        loads.append(main.load_monitor.load())
+        return {"response": "", "professionals": [], "query": request.query,
+                "cached": False, "degradations": []}
+
+    monkeypatch.setattr(main, "execute_search", slow_search)
+
+    async def run():
+        request = main.QueryRequest(query="búsqueda de portada", top_k=3)
+        searches = [main.coalesced_search(request) for _ in range(10)]
+        searches.append(main.coalesced_search(request, deadline_ms=50))
+        return await asyncio.gather(*searches)
+
+    asyncio.run(run())
+    # Una ejecución sin deadline y otra con deadline; los 9 en espera no suman carga
+    assert len(loads) == 2
+    assert max(loads) * main.load_monitor.high_watermark <= 2
+
+def test_paged_search():
+    """Test de búsqueda paginada con cursor"""
+    response = client.post(
+        "/api/rag/search/paged",
+        json={"query": "desarrollador", "page_size": 2}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["page"] == 1
+    assert len(data["professionals"]) <= 2
+
+    seen = [p.get("id") for p in data["professionals"]]
+    while data["has_more"]:
+        response = client.post("/api/rag/search/next", json={"cursor": data["cursor"]})
+        assert response.status_code == 200
+        data = response.json()
+        seen.extend(p.get("id") for p in data["professionals"])
+
+    # Ningún perfil se repite entre páginas
+    assert len(seen) == len(set(seen))
+    assert data["cursor"] is None
+
+def test_paged_search_unknown_cursor():
+    """Test de cursor inexistente"""
+    response = client.post("/api/rag/search/next", json={"cursor": "no-existe"})
+    assert response.status_code == 404
+
+def test_query_log(tmp_path, monkeypatch):
+    """Test del registro de queries"""
+    import main
+    path = str(tmp_path / "query_log.jsonl")
+    monkeypatch.setattr(main, "query_log", main.QueryLog(path, max_bytes=0))
+
+    client.post("/api/rag/search", json={"query": "arquitecto cloud", "top_k": 2})
+    main.query_log.flush()
+
+    entries = main.read_query_log(path, 1000)
+    entry = [e for e in entries if e["query"] == "arquitecto cloud"][-1]
+    assert entry["top_k"] == 2
+    assert "latency_ms" in entry
+    assert isinstance(entry["result_ids"], list)
+
+def test_top_logged_queries():
+    """Test de ranking de búsquedas frecuentes"""
+    from main import top_logged_queries
+    entries = [
+        {"query": "a", "cache_key": "k1"},
+        {"query": "b", "cache_key": "k2"},
+        {"query": "b", "cache_key": "k2"},
+    ]
+    top = top_logged_queries(entries, 1)
+    assert len(top) == 1
+    assert top[0]["cache_key"] == "k2"
+    assert top[0]["count"] == 2
+
+def test_legacy_collection_migrated_once(tmp_path):
+    """Test de migración de la colección única: se copia y se elimina"""
+    import chromadb
+    from main import ShardedVectorStore, embeddings
+
+    legacy_client = chromadb.PersistentClient(path=str(tmp_path))
+    legacy = legacy_client.get_or_create_collection("talent_profiles")
+    legacy.add(ids=["a"], embeddings=[embeddings.embed_query("perfil")],
+               documents=["perfil"], metadatas=[{"id": 1}])
+
+    store = ShardedVectorStore(legacy_client, embeddings, strategy="hash", num_shards=2)
+    assert store.migrate_legacy_collection() == 1
+    assert store.count() == 1
+    names = [getattr(c, "name", c) for c in legacy_client.list_collections()]
+    assert "talent_profiles" not in names
+
+    # Borrar todo y reiniciar no resucita perfiles
+    store.mark_deleted("1")
+    store.compact()
+    assert store.migrate_legacy_collection() == 0
+    assert store.count() == 0
+
+def test_delete_profile_flush_timeout(monkeypatch):
+    """Test de PUT/DELETE con la cola de indexación bloqueada"""
+    import main
+    monkeypatch.setattr(main.indexing_queue, "flush", lambda timeout=None: False)
+    assert client.delete("/api/profiles/2000").status_code == 504
+    assert client.put("/api/profiles/2000", json=_test_profile(2000)).status_code == 504
+
+def test_paged_search_with_deleted_profile():
+    """Test de paginación cuando se borra un perfil entre páginas"""
+    profiles = [_test_profile(3000 + i) for i in range(3)]
+    for profile in profiles:
+        profile["location"] = {"city": "Pagination City", "distance": 5}
+    client.post("/api/profiles/index-batch", json=profiles)
+    client.post("/api/profiles/flush")
+
+    data = client.post(
+        "/api/rag/search/paged",
+        json={"query": "Test User", "filters": {"city": "Pagination City"}, "page_size": 1}
+    ).json()
+    seen = [p["id"] for p in data["professionals"]]
+    deleted = next(p["id"] for p in profiles if p["id"] not in seen)
+    assert client.delete(f"/api/profiles/{deleted}").status_code == 200
+
+    pages = 0
+    while data["has_more"]:
+        pages += 1
+        assert pages <= 5, "el cursor no termina"
+        data = client.post("/api/rag/search/next", json={"cursor": data["cursor"]}).json()
+        seen.extend(p["id"] for p in data["professionals"])
+
+    assert deleted not in seen
+    assert sorted(seen) == sorted(p["id"] for p in profiles if p["id"] != deleted)
+
+def test_query_log_rotation_and_tail(tmp_path):
+    """Test de rotación del registro y lectura de las últimas entradas"""
+    from main import QueryLog, read_query_log, tail_lines
+
+    path = str(tmp_path / "query_log.jsonl")
+    log = QueryLog(path, max_bytes=200)
+    for i in range(20):
+        log.record({"query": f"q{i}", "cache_key": f"k{i}"})
+        log.flush()
+
+    assert (tmp_path / "query_log.jsonl.1").exists()
+    entries = read_query_log(path, 5)
+    assert [e["query"] for e in entries] == [f"q{i}" for i in range(15, 20)]
+
+    lines_file = tmp_path / "lines.txt"
+    lines_file.write_text("\n".join(f"linea {i}" for i in range(10)) + "\n")
+    assert tail_lines(str(lines_file), 3, block_size=8) == ["linea 7", "linea 8", "linea 9"]
+
+def test_search_after_many_deletes(tmp_path):
+    """Test de búsqueda con muchos borrados sin compactar: no se piden resultados de más"""
+    import chromadb
+    from main import ShardedVectorStore, embeddings
+
+    store = ShardedVectorStore(chromadb.PersistentClient(path=str(tmp_path)), embeddings,
+                               strategy="hash", num_shards=2)
+    vector = embeddings.embed_query("perfil")
+    ids = [str(i) for i in range(50)]
+    store.add_embeddings(ids, [vector] * 50, ["perfil"] * 50, [{"id": i} for i in range(50)])
+    for doc_id in ids[:40]:
+        store.mark_deleted(doc_id)
+
+    class SpyCollection:
+        def __init__(self, collection, calls):
+            self._collection = collection
+            self._calls = calls
+
+        def __getattr__(self, name):
+            return getattr(self._collection, name)
+
+        def query(self, **kwargs):
+            self._calls.append(kwargs["n_results"])
+            return self._collection.query(**kwargs)
+
+    calls = []
+    for name in list(store._collections):
+        store._collections[name] = SpyCollection(store._collections[name], calls)
+
+    docs = store.similarity_search_by_vector(vector, k=4)
+    assert len(calls) == 2
+    assert all(n_results <= 4 for n_results in calls)
+    assert len(docs) == 4
+    assert all(doc.metadata["id"] >= 40 for doc in docs)
+
+def test_shard_layout_change(tmp_path):
+    """Test de cambio de NUM_SHARDS/SHARD_STRATEGY: el índice se re-particiona al arrancar"""
+    import json
+    import chromadb
+    from main import ShardedVectorStore, embeddings
+
+    chroma = chromadb.PersistentClient(path=str(tmp_path / "db"))
+    layout_file = str(tmp_path / "shard_layout.json")
+    vector = embeddings.embed_query("perfil")
+    ids = [str(i) for i in range(10)]
+    metadatas = [{"id": i, "location": json.dumps({"city": f"Ciudad {i % 3}"})} for i in range(10)]
+
+    store = ShardedVectorStore(chroma, embeddings, strategy="hash", num_shards=4, layout_file=layout_file)
+    assert store.apply_layout() == 0
+    store.add_embeddings(ids, [vector] * 10, ["perfil"] * 10, metadatas)
+
+    for strategy, num_shards in (("hash", 2), ("location", 2)):
+        store = ShardedVectorStore(chroma, embeddings, strategy=strategy, num_shards=num_shards,
+                                   layout_file=layout_file)
+        assert store.apply_layout() == 10
+        assert store.count() == 10
+        assert all(store.get_document(doc_id) is not None for doc_id in ids)
+
+    assert len(store.shard_counts()) == 3
+
+def test_search_not_cached_after_invalidation(monkeypatch):
+    """Test de búsqueda concurrente con un cambio en el corpus: su resultado no se cachea"""
+    import os
+    import main
+
+    search = main.vectorstore.similarity_search_by_vector
+
+    def search_then_invalidate(*args, **kwargs):
+        docs = search(*args, **kwargs)
+        # Un DELETE/PUT termina mientras la búsqueda sigue en curso
+        main.invalidate_search_cache()
+        return docs
+
+    monkeypatch.setattr(main.vectorstore, "similarity_search_by_vector", search_then_invalidate)
+    request = main.QueryRequest(query="especialista en borrados concurrentes", top_k=2)
+    main.execute_search(request)
+
+    cache_key = main.get_cache_key(request.query, request.filters, request.top_k)
+    assert not os.path.exists(f"{main.CACHE_DIR}/{cache_key}.json")
+    assert main.semantic_cache.stats()["entries"] == 0